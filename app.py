@@ -1,8 +1,14 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-import json
+import copy
+import functools
+import html
 import io
+import itertools
+import re
 import traceback
 
 # Page configuration with error handling
@@ -16,8 +22,11 @@ try:
 except Exception:
     pass  # Already set
 
-# Custom CSS with color support
-st.markdown("""
+# Custom CSS with color support, defined once at module level. It still has
+# to be emitted on every rerun — Streamlit rebuilds the element tree each
+# run, so a style block skipped via a session sentinel would vanish from
+# the page — but the string itself is only constructed once.
+_APP_CSS = """
 <style>
     .timetable-container {
         background-color: white;
@@ -72,36 +81,42 @@ st.markdown("""
         margin-top: 1rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_APP_CSS, unsafe_allow_html=True)
+
+# Session defaults never change, so build them once at import time instead of
+# rebuilding the dict on every init_session_state call (Streamlit reruns the
+# whole script on each interaction)
+_SESSION_DEFAULTS = {
+    'school_name': "Cape Coast Secondary",
+    'classes': ['JHS1', 'JHS2', 'JHS3'],
+    'days': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+    'subjects': {
+        'English': {'hours_per_week': 5, 'teacher': '', 'single_teacher': False, 'no_clash': False},
+        'Mathematics': {'hours_per_week': 5, 'teacher': '', 'single_teacher': False, 'no_clash': False},
+        'Integrated Science': {'hours_per_week': 4, 'teacher': '', 'single_teacher': False, 'no_clash': False},
+        'Social Studies': {'hours_per_week': 3, 'teacher': '', 'single_teacher': False, 'no_clash': False},
+        'ICT': {'hours_per_week': 2, 'teacher': '', 'single_teacher': False, 'no_clash': False}
+    },
+    'teachers': [],
+    'time_slots': {},  # {day: [{'start': '7:30 AM', 'end': '8:30 AM', 'name': 'Period 1'}, ...]}
+    'fixed_events': [],  # Events spanning multiple days
+    'fixed_assignments': [],  # Non-negotiable assignments
+    'timetable_data': {},  # {class: encoded entry, see _store_timetable}
+    'timetable_colors': {},  # {class: {slot_key: color}}
+    'other_timetable': None,  # Uploaded timetable for clash checking
+    'generation_status': {}
+}
 
 # Initialize session state with all required variables
 def init_session_state():
     """Initialize all session state variables with error handling"""
     try:
-        defaults = {
-            'school_name': "Cape Coast Secondary",
-            'classes': ['JHS1', 'JHS2', 'JHS3'],
-            'days': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
-            'subjects': {
-                'English': {'hours_per_week': 5, 'teacher': '', 'single_teacher': False, 'no_clash': False},
-                'Mathematics': {'hours_per_week': 5, 'teacher': '', 'single_teacher': False, 'no_clash': False},
-                'Integrated Science': {'hours_per_week': 4, 'teacher': '', 'single_teacher': False, 'no_clash': False},
-                'Social Studies': {'hours_per_week': 3, 'teacher': '', 'single_teacher': False, 'no_clash': False},
-                'ICT': {'hours_per_week': 2, 'teacher': '', 'single_teacher': False, 'no_clash': False}
-            },
-            'teachers': [],
-            'time_slots': {},  # {day: [{'start': '7:30 AM', 'end': '8:30 AM', 'name': 'Period 1'}, ...]}
-            'fixed_events': [],  # Events spanning multiple days
-            'fixed_assignments': [],  # Non-negotiable assignments
-            'timetable_data': {},  # {class: (DataFrame, all_slots)}
-            'timetable_colors': {},  # {class: {slot_key: color}}
-            'other_timetable': None,  # Uploaded timetable for clash checking
-            'generation_status': {}
-        }
-        
-        for key, value in defaults.items():
+        for key, value in _SESSION_DEFAULTS.items():
             if key not in st.session_state:
-                st.session_state[key] = value
+                # Copy so per-session edits never leak into the shared defaults
+                st.session_state[key] = copy.deepcopy(value)
     except Exception as e:
         st.error(f"Error initializing session state: {str(e)}")
 
@@ -112,16 +127,24 @@ except Exception:
     pass  # Continue even if initialization fails
 
 # Helper functions
+# Checked before strptime so partially-typed times (every keystroke in the
+# Settings tab reruns the script) return None without raising an exception
+_TIME_12H_RE = re.compile(r'^\s*\d{1,2}:\d{1,2}\s*[AP]M\s*$', re.IGNORECASE)
+_TIME_24H_RE = re.compile(r'^\s*\d{1,2}:\d{1,2}\s*$')
+
+@functools.lru_cache(maxsize=1024)
 def parse_time(time_str):
     """Parse time string to datetime object"""
     try:
-        return datetime.strptime(time_str.strip(), "%I:%M %p")
-    except:
-        try:
+        if _TIME_12H_RE.match(time_str):
+            return datetime.strptime(time_str.strip(), "%I:%M %p")
+        if _TIME_24H_RE.match(time_str):
             return datetime.strptime(time_str.strip(), "%H:%M")
-        except:
-            return None
+    except (ValueError, TypeError):
+        pass
+    return None
 
+@functools.lru_cache(maxsize=1024)
 def time_to_minutes(time_str):
     """Convert time string to minutes since midnight"""
     dt = parse_time(time_str)
@@ -154,168 +177,368 @@ def validate_time_slots():
     """Validate time slots for overlaps and errors"""
     errors = []
     warnings = []
-    
+    time_slots = st.session_state.time_slots  # local alias, skips the proxy per day
+
     for day in st.session_state.days:
-        if day not in st.session_state.time_slots:
+        if day not in time_slots:
             continue
-        slots = st.session_state.time_slots[day]
-        for i, slot1 in enumerate(slots):
-            for j, slot2 in enumerate(slots):
-                if i != j:
-                    if check_time_overlap(slot1['start'], slot1['end'], slot2['start'], slot2['end']):
-                        errors.append(f"{day}: Overlapping time slots: {slot1['name']} and {slot2['name']}")
-    
+        slots = time_slots[day]
+        # Parse each slot's times once, skipping any that fail to parse
+        minutes = [(time_to_minutes(s['start']), time_to_minutes(s['end'])) for s in slots]
+        parsed = [(i, m) for i, m in enumerate(minutes) if m[0] is not None and m[1] is not None]
+        if len(parsed) < 2:
+            continue
+
+        # Broadcast interval comparison: one boolean matrix instead of a
+        # Python pairwise loop; only the offending pairs are formatted
+        idxs = [i for i, _ in parsed]
+        starts = np.array([m[0] for _, m in parsed], dtype=np.int32)
+        ends = np.array([m[1] for _, m in parsed], dtype=np.int32)
+        mask = (starts[:, None] < ends[None, :]) & (ends[:, None] > starts[None, :])
+        for a, b in np.argwhere(np.triu(mask, k=1)):
+            errors.append(f"{day}: Overlapping time slots: {slots[idxs[a]]['name']} and {slots[idxs[b]]['name']}")
+
     return errors, warnings
 
-def generate_timetable_grid(class_name, days, time_slots_dict):
-    """Generate blank timetable grid for a class with size limits"""
-    # Collect all unique time slots across days
-    all_slots = []
-    slot_keys = {}  # Map (day, start, end) to slot name
-    
-    # Limit total slots to prevent memory issues
+@st.cache_data(show_spinner=False, max_entries=32)
+def _build_grid(days_tuple, slots_tuple):
+    """Build the blank grid and slot list from frozen (hashable) inputs.
+
+    Cached so tab switches and unrelated reruns skip the rebuild;
+    st.cache_data hands back a fresh copy on every call, so callers can
+    mutate the returned frame without corrupting the cache.
+    """
+    # Collect all unique time slots across days, capped to prevent
+    # memory issues. A single insertion-ordered dict handles both dedup
+    # and ordering, and islice replaces the per-iteration bounds checks.
     max_slots = 100
-    
-    for day in days:
-        if day in time_slots_dict and len(all_slots) < max_slots:
-            for slot in time_slots_dict[day]:
-                if len(all_slots) >= max_slots:
-                    break
-                key = (day, slot['start'], slot['end'])
-                if key not in slot_keys:
-                    slot_keys[key] = slot['name']
-                    all_slots.append({
-                        'day': day,
-                        'start': slot['start'],
-                        'end': slot['end'],
-                        'name': slot['name']
-                    })
-    
+    flat = ((day, slot) for day, slots in slots_tuple for slot in slots)
+    seen = {}
+
+    for day, (name, start, end) in itertools.islice(flat, max_slots):
+        key = (day, start, end)
+        if key in seen:
+            continue
+        seen[key] = {
+            'day': day,
+            'start': start,
+            'end': end,
+            'name': name,
+            # Parsed once here; downstream overlap checks compare
+            # these ints instead of re-parsing the strings
+            'start_min': time_to_minutes(start),
+            'end_min': time_to_minutes(end)
+        }
+
+    all_slots = list(seen.values())
+
     if not all_slots:
         raise ValueError("No time slots defined. Please add time slots in the 'Time Slots' tab.")
-    
-    # Create DataFrame with time slots as rows and days as columns
-    data = {}
-    for day in days:
-        data[day] = ['' for _ in all_slots]
-    
+
+    # Create DataFrame with time slots as rows and days as columns, built
+    # in a single constructor call rather than cell-by-cell assignment
+    data = {day: [''] * len(all_slots) for day in days_tuple}
+
     df = pd.DataFrame(data, index=[f"{s['name']} ({s['start']}-{s['end']})" for s in all_slots])
     df.index.name = 'Time Slots'
-    
+
     return df, all_slots
 
-def apply_fixed_events(df, all_slots, fixed_events):
+def generate_timetable_grid(class_name, days, time_slots_dict):
+    """Generate blank timetable grid for a class with size limits"""
+    # Freeze the inputs so the cached builder can hash them
+    days_tuple = tuple(days)
+    slots_tuple = tuple(
+        (day, tuple((s['name'], s['start'], s['end']) for s in time_slots_dict[day]))
+        for day in days if day in time_slots_dict
+    )
+    df, all_slots = _build_grid(days_tuple, slots_tuple)
+
+    # Lookup tables for the appliers: exact slot position by
+    # (day, start, end), and every slot row sharing a (start, end) pair
+    # for events that repeat across days
+    slot_index = {(s['day'], s['start'], s['end']): i for i, s in enumerate(all_slots)}
+    same_time_index = defaultdict(list)
+    for i, s in enumerate(all_slots):
+        same_time_index[(s['start'], s['end'])].append(i)
+
+    return df, all_slots, slot_index, dict(same_time_index)
+
+def _encode_grid(df):
+    """Encode a grid's cell strings as an int16 code array plus categories.
+
+    The value universe (subjects, events, teacher tags) is tiny, so codes
+    are far cheaper to keep in session state than an object DataFrame.
+    """
+    values = df.to_numpy().astype(str)
+    categories, codes = np.unique(values, return_inverse=True)
+    return codes.astype(np.int16).reshape(values.shape), categories.tolist()
+
+def _decode_grid(grid, categories, index, columns):
+    """Materialize a display DataFrame from an int16 code grid"""
+    values = np.take(np.asarray(categories, dtype=object), grid)
+    df = pd.DataFrame(values, index=list(index), columns=list(columns))
+    df.index.name = 'Time Slots'
+    return df
+
+# Most recently used classes we keep timetables for; plain dicts keep
+# insertion order, so re-inserting on store/load gives true LRU eviction
+_MAX_TIMETABLES = 10
+
+def _store_timetable(class_name, df, all_slots):
+    """Put a generated timetable into session state in encoded form.
+
+    The code grid is kept as raw bytes rather than a live ndarray: the
+    payload for a typical grid is well under 1 KB, pickles trivially, and
+    carries no pandas/numpy object machinery through session state.
+    """
+    grid, categories = _encode_grid(df)
+    data = st.session_state.timetable_data
+    data.pop(class_name, None)  # re-insert so this class becomes newest
+    data[class_name] = {
+        'cells': grid.tobytes(),
+        'shape': grid.shape,
+        'categories': categories,
+        'index': tuple(df.index),
+        'columns': tuple(df.columns),
+        'slots': all_slots,
+    }
+    while len(data) > _MAX_TIMETABLES:
+        data.pop(next(iter(data)))  # evict the least recently used class
+
+def _load_timetable(timetable_data, class_name):
+    """Rebuild (df, all_slots) for a class stored by _store_timetable"""
+    # Re-insert on access so viewing a timetable refreshes its LRU rank
+    entry = timetable_data[class_name] = timetable_data.pop(class_name)
+    grid = np.frombuffer(entry['cells'], dtype=np.int16).reshape(entry['shape'])
+    df = _decode_grid(grid, entry['categories'], entry['index'], entry['columns'])
+    return df, entry['slots']
+
+def apply_fixed_events(df, all_slots, fixed_events, same_time_index):
     """Apply fixed events that span multiple days"""
+    days = st.session_state.days  # avoid proxy lookups in the loop
+    # Column positions resolved once; positional writes skip label lookup
+    # on both axes and stay correct even when period names repeat across days
+    day_cols = [df.columns.get_loc(day) for day in days]
+
     for event in fixed_events:
         if event.get('same_all_days', False):
-            # Find matching time slots
-            event_start = event['start_time']
-            event_end = event['end_time']
-            
-            for idx, slot in enumerate(all_slots):
-                if slot['start'] == event_start and slot['end'] == event_end:
-                    # Apply to all days
-                    for day in st.session_state.days:
-                        df.loc[df.index[idx], day] = event['name']
-                    break
+            # O(1) lookup of the matching slot row via the index built at
+            # grid time; first match keeps the previous scan's behavior
+            indices = same_time_index.get((event['start_time'], event['end_time']))
+            if not indices:
+                continue
+            idx = indices[0]
+            # One row-wide assignment covers every day at once
+            df.iloc[idx, day_cols] = event['name']
 
-def apply_fixed_assignments(df, all_slots, fixed_assignments, class_name):
+def apply_fixed_assignments(df, all_slots, fixed_assignments, class_name, slot_index):
     """Apply non-negotiable fixed assignments"""
+    # slot_index comes prebuilt from generate_timetable_grid, so each
+    # assignment is an O(1) dict lookup instead of a scan over all_slots
+    col_idx = {day: df.columns.get_loc(day) for day in st.session_state.days}
+
     for assignment in fixed_assignments:
         if assignment.get('class') != class_name:
             continue
-        
+
         day = assignment['day']
-        start = assignment['start_time']
-        end = assignment['end_time']
-        subject = assignment.get('subject', '')
+        idx = slot_index.get((day, assignment['start_time'], assignment['end_time']))
+        if idx is None or day not in col_idx:
+            continue
+
+        value = assignment.get('subject', '')
         teacher = assignment.get('teacher', '')
-        
-        # Find matching slot
-        for idx, slot in enumerate(all_slots):
-            if slot['day'] == day and slot['start'] == start and slot['end'] == end:
-                value = subject
-                if teacher:
-                    value += f" ({teacher})"
-                df.loc[df.index[idx], day] = value
-                break
+        if teacher:
+            value += f" ({teacher})"
+        df.iat[idx, col_idx[day]] = value
 
 def auto_generate_subjects(df, all_slots, class_name, subjects_dict):
     """Automatically assign subjects to time slots"""
-    # Count remaining hours needed per subject
+    # Bind session state to a local once; every st.session_state attribute
+    # access goes through the proxy's __getattr__, which adds up inside
+    # the nested loops below
+    days = st.session_state.days
+
+    # Count remaining hours needed per subject: one vectorized pass that
+    # strips the teacher suffix from every cell and tallies the base
+    # names, instead of rescanning the grid per subject. Exact base-name
+    # matching also stops one subject counting towards another that
+    # contains it as a substring.
+    base_names = df[list(days)].stack().astype(str).str.split('(', n=1).str[0].str.strip()
+    assigned_counts = base_names.value_counts()
     subject_hours = {}
     for subject, data in subjects_dict.items():
         hours = data.get('hours_per_week', 0)
-        # Count already assigned hours
-        assigned = 0
-        for idx, slot in enumerate(all_slots):
-            for day in st.session_state.days:
-                cell_value = df.loc[df.index[idx], day]
-                if subject in str(cell_value):
-                    assigned += 1
-        subject_hours[subject] = max(0, hours - assigned)
-    
-    # Round-robin assignment
-    subjects_list = [s for s, h in subject_hours.items() if h > 0]
-    if not subjects_list:
+        subject_hours[subject] = max(0, hours - int(assigned_counts.get(subject, 0)))
+
+    # Round-robin assignment, vectorized: find every empty cell in one
+    # mask pass, build the subject sequence up front, then write all
+    # assignments with a single fancy-indexed store instead of per-cell
+    # df.loc writes
+    pending = deque(s for s, h in subject_hours.items() if h > 0)
+    if not pending:
         return
-    
-    subject_idx = 0
-    for idx, slot in enumerate(all_slots):
-        for day in st.session_state.days:
-            if df.loc[df.index[idx], day] == '':
-                if subject_idx < len(subjects_list):
-                    subject = subjects_list[subject_idx]
-                    df.loc[df.index[idx], day] = subject
-                    subject_hours[subject] -= 1
-                    if subject_hours[subject] <= 0:
-                        subjects_list.remove(subject)
-                        if not subjects_list:
-                            return
-                        subject_idx = subject_idx % len(subjects_list)
-                    else:
-                        subject_idx = (subject_idx + 1) % len(subjects_list)
+
+    values = df[list(days)].to_numpy()
+    empty_positions = np.argwhere(values == '')  # row-major: slot, then day
+    if len(empty_positions) == 0:
+        return
+
+    # Cycle via deque rotation: advancing and dropping an exhausted
+    # subject are both O(1), unlike list.remove mid-iteration
+    queue = []
+    while pending and len(queue) < len(empty_positions):
+        subject = pending[0]
+        queue.append(subject)
+        subject_hours[subject] -= 1
+        if subject_hours[subject] <= 0:
+            pending.popleft()
+        else:
+            pending.rotate(-1)
+
+    k = min(len(queue), len(empty_positions))
+    rows, cols = empty_positions[:k].T
+    values[rows, cols] = queue[:k]
+    df.loc[:, list(days)] = values
+
+# Matches "Subject (Teacher)" cells; used to pull both parts out of the
+# whole grid in one vectorized pass
+_TEACHER_RE = re.compile(r'^(.*?)\s*\(([^)]+)\)\s*$')
 
 def check_teacher_clashes(timetable_data, class_name):
     """Check for teacher clashes within and across classes"""
     clashes = []
-    teacher_schedule = {}  # {teacher: [(day, start, end, class, subject)]}
-    
-    # Check current class
-    if class_name in timetable_data:
-        df, all_slots = timetable_data[class_name]
-        for idx, slot in enumerate(all_slots):
-            for day in st.session_state.days:
-                cell_value = str(df.loc[df.index[idx], day])
-                if cell_value and '(' in cell_value:
-                    # Extract teacher name
-                    parts = cell_value.split('(')
-                    if len(parts) > 1:
-                        teacher = parts[1].rstrip(')').strip()
-                        if teacher:
-                            key = (day, slot['start'], slot['end'])
-                            if teacher not in teacher_schedule:
-                                teacher_schedule[teacher] = []
-                            teacher_schedule[teacher].append((day, slot['start'], slot['end'], class_name, parts[0].strip()))
-    
-    # Check for overlaps
-    for teacher, schedule in teacher_schedule.items():
-        for i, (day1, start1, end1, class1, subj1) in enumerate(schedule):
-            for j, (day2, start2, end2, class2, subj2) in enumerate(schedule):
-                if i != j and day1 == day2:
-                    if check_time_overlap(start1, end1, start2, end2):
-                        clashes.append(f"Teacher '{teacher}' double-booked: {class1} {subj1} and {class2} {subj2} on {day1}")
-    
+
+    # Nothing generated for this class yet — skip the whole scan
+    if class_name not in timetable_data:
+        return clashes
+    df, all_slots = _load_timetable(timetable_data, class_name)
+    if df.empty:
+        return clashes
+
+    # Extract (subject, teacher) from every cell with one regex pass over
+    # the stacked frame instead of Python split calls per cell
+    days = st.session_state.days
+    flat = df[list(days)].reset_index(drop=True).stack()
+    extracted = flat.astype(str).str.extract(_TEACHER_RE)
+    extracted.columns = ['subject', 'teacher']
+    extracted = extracted.dropna(subset=['teacher'])
+    if extracted.empty:
+        return clashes
+
+    slot_rows = extracted.index.get_level_values(0)
+    schedule = pd.DataFrame({
+        'teacher': extracted['teacher'].str.strip().to_numpy(),
+        'day': extracted.index.get_level_values(1),
+        'start_min': [all_slots[i].get('start_min') for i in slot_rows],
+        'end_min': [all_slots[i].get('end_min') for i in slot_rows],
+        'subject': extracted['subject'].str.strip().to_numpy(),
+    })
+    schedule = schedule[schedule['teacher'] != ''].dropna(subset=['start_min', 'end_min'])
+
+    # Within each (teacher, day) group, sort by start time; once a later
+    # lesson starts at or after lesson i ends, nothing further can overlap
+    # lesson i, so the scan is O(n log n) plus one step per actual clash
+    for (teacher, day), group in schedule.groupby(['teacher', 'day']):
+        if len(group) < 2:
+            continue
+        group = group.sort_values('start_min')
+        starts = group['start_min'].to_numpy()
+        ends = group['end_min'].to_numpy()
+        subjects = group['subject'].to_numpy()
+        for i in range(len(group)):
+            for j in range(i + 1, len(group)):
+                if starts[j] >= ends[i]:
+                    break
+                clashes.append(f"Teacher '{teacher}' double-booked: {class_name} {subjects[i]} and {class_name} {subjects[j]} on {day}")
+
     return clashes
 
+_CELL_TMPL = '<td style="background-color: %s; color: %s;">%s</td>'
+
+# Fixed palette for timetable cells, and the text color that contrasts
+# with each entry — resolved once at import instead of per cell render
+_COLOR_OPTIONS = {
+    'Red': '#ff6b6b',
+    'Blue': '#4ecdc4',
+    'Green': '#95e1d3',
+    'Yellow': '#fce38a',
+    'Orange': '#f38181',
+    'Purple': '#aa96da',
+    'Pink': '#fcbad3',
+    'Gray': '#d3d3d3',
+    'White': '#ffffff',
+    'Black': '#000000'
+}
+_CONTRAST = {hex_code: '#ffffff' if hex_code == '#000000' else '#000000'
+             for hex_code in _COLOR_OPTIONS.values()}
+
+@st.cache_data(show_spinner=False)
+def build_timetable_html(records, index_labels, days, color_items):
+    """Render the timetable as an HTML table, cached on its inputs"""
+    # One (bg, text) pair per colored key, resolved before the cell loop
+    # so each cell costs a single dict lookup
+    color_lut = {key: (bg, _CONTRAST.get(bg, '#000000'))
+                 for key, bg in color_items}
+    default_colors = ('#ffffff', '#000000')
+    # Cell values repeat heavily, so escape each distinct value once and
+    # look it up per cell; user-entered text must not land in the markup raw
+    escape_map = {v: html.escape(v) for row in records for v in row}
+    parts = [
+        '<div class="timetable-container">'
+        '<table class="timetable-table">'
+        '<thead><tr><th class="period-header">Time Slots</th>'
+    ]
+    for day in days:
+        parts.append(f'<th class="period-header">{html.escape(day)}</th>')
+    parts.append("</tr></thead><tbody>")
+
+    for label, row in zip(index_labels, records):
+        parts.append(f"<tr><td><strong>{html.escape(label)}</strong></td>")
+        for cell_value in row:
+            cell_key = cell_value.split('(')[0].strip() if cell_value else ''
+            bg_color, text_color = color_lut.get(cell_key, default_colors)
+            parts.append(_CELL_TMPL % (bg_color, text_color, escape_map[cell_value]))
+        parts.append("</tr>")
+
+    parts.append("</tbody></table></div>")
+    return ''.join(parts)
+
+@st.cache_data(show_spinner=False)
+def export_to_csv(df):
+    """Serialize a timetable DataFrame to CSV, cached on its contents"""
+    return df.to_csv(index=True)
+
+@st.cache_data(show_spinner=False)
+def export_to_parquet(df):
+    """Serialize a timetable DataFrame to Parquet (zstd-compressed)"""
+    output = io.BytesIO()
+    df.to_parquet(output, compression='zstd')
+    return output.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_uploaded(name, data):
+    """Parse an uploaded timetable, cached on the file's bytes"""
+    buf = io.BytesIO(data)
+    if name.endswith('.csv'):
+        return pd.read_csv(buf)
+    # Legacy .xls is BIFF, which openpyxl cannot open; route it to xlrd
+    engine = 'xlrd' if name.endswith('.xls') else 'openpyxl'
+    return pd.read_excel(buf, engine=engine)
+
+@st.cache_data(show_spinner=False)
 def export_to_excel(timetable_data):
     """Export all timetables to Excel with error handling"""
     try:
         output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # xlsxwriter writes faster than openpyxl's pure-Python path. Do NOT
+        # enable constant_memory here: to_excel emits cells column-by-column
+        # and that mode silently discards writes to already-flushed rows.
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
             for class_name, data in timetable_data.items():
                 if isinstance(data, tuple):
-                    df, _ = data
+                    df = data[0]
                 else:
                     df = data
                 # Limit sheet name length
@@ -323,78 +546,77 @@ def export_to_excel(timetable_data):
                 df.to_excel(writer, sheet_name=sheet_name)
         return output.getvalue()
     except ImportError:
-        raise ImportError("openpyxl is required for Excel export. Install with: pip install openpyxl")
+        raise ImportError("xlsxwriter is required for Excel export. Install with: pip install xlsxwriter")
     except Exception as e:
         raise Exception(f"Error exporting to Excel: {str(e)}")
 
-# Main app with comprehensive error handling
-try:
-    # Add loading state to prevent multiple simultaneous operations
-    if 'app_ready' not in st.session_state:
-        st.session_state.app_ready = True
+# Removal callbacks. Streamlit runs these before the rerun the click
+# triggers, so one click removes the item in a single cycle — no
+# collect-then-pop list and no explicit st.rerun needed.
+def _remove_subject(name):
+    st.session_state.subjects.pop(name, None)
+
+def _remove_time_slot(day, idx):
+    slots = st.session_state.time_slots.get(day, [])
+    if idx < len(slots):
+        slots.pop(idx)
+
+def _remove_fixed_event(idx):
+    if idx < len(st.session_state.fixed_events):
+        st.session_state.fixed_events.pop(idx)
+
+def _remove_fixed_assignment(idx):
+    if idx < len(st.session_state.fixed_assignments):
+        st.session_state.fixed_assignments.pop(idx)
+
+# Each tab body runs inside a fragment, so a widget interaction that
+# originates in one tab reruns only that tab's function instead of the
+# entire script (including every other tab's render loops)
+@st.fragment
+def _render_setup_tab():
+    """Render the school/class/subject setup tab"""
+    st.header("School & Class Setup")
     
-    if not st.session_state.app_ready:
-        st.warning("App is initializing... Please wait.")
-        st.stop()
+    col1, col2 = st.columns(2)
+    with col1:
+        school_name = st.text_input("School Name", value=st.session_state.school_name)
+        st.session_state.school_name = school_name
     
-    st.title("📅 Ghana Timetable Generator")
-    st.markdown("**By Samuel Nhyira Cann**")
-    st.markdown("---")
+    with col2:
+        st.subheader("Classes")
+        classes_input = st.text_area(
+            "Enter classes (one per line)",
+            value="\n".join(st.session_state.classes),
+            height=100
+        )
+        if classes_input:
+            st.session_state.classes = [c.strip() for c in classes_input.split('\n') if c.strip()]
     
-    # Tabs
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "Setup", "Time Slots", "Fixed Events", "Fixed Assignments", 
-        "Integrate Other Timetable", "Generate & View"
-    ])
+    st.markdown("---")
+    st.subheader("Subjects Management")
     
-    # TAB 1: SETUP
-    with tab1:
-        st.header("School & Class Setup")
-        
-        col1, col2 = st.columns(2)
+    # Display existing subjects
+    for subject_name, subject_data in list(st.session_state.subjects.items()):
+        col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 2, 1])
         with col1:
-            school_name = st.text_input("School Name", value=st.session_state.school_name)
-            st.session_state.school_name = school_name
-        
+            st.text_input("Subject", value=subject_name, key=f"subj_display_{subject_name}", disabled=True)
         with col2:
-            st.subheader("Classes")
-            classes_input = st.text_area(
-                "Enter classes (one per line)",
-                value="\n".join(st.session_state.classes),
-                height=100
-            )
-            if classes_input:
-                st.session_state.classes = [c.strip() for c in classes_input.split('\n') if c.strip()]
-        
-        st.markdown("---")
-        st.subheader("Subjects Management")
-        
-        # Display existing subjects
-        subjects_to_remove = []
-        for subject_name, subject_data in list(st.session_state.subjects.items()):
-            col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 2, 1])
-            with col1:
-                st.text_input("Subject", value=subject_name, key=f"subj_display_{subject_name}", disabled=True)
-            with col2:
-                hours = st.number_input("Hours/Week", min_value=1, max_value=20, value=subject_data['hours_per_week'], key=f"hours_{subject_name}")
-                st.session_state.subjects[subject_name]['hours_per_week'] = hours
-            with col3:
-                teacher = st.text_input("Teacher", value=subject_data.get('teacher', ''), key=f"teacher_{subject_name}")
-                st.session_state.subjects[subject_name]['teacher'] = teacher
-            with col4:
-                single_teacher = st.checkbox("Single Teacher Only", value=subject_data.get('single_teacher', False), key=f"single_{subject_name}")
-                st.session_state.subjects[subject_name]['single_teacher'] = single_teacher
-            with col5:
-                if st.button("Remove", key=f"remove_subj_{subject_name}"):
-                    subjects_to_remove.append(subject_name)
-        
-        for subject in subjects_to_remove:
-            del st.session_state.subjects[subject]
-            if st.button("Confirm Remove", key=f"confirm_remove_{subject}"):
-                st.rerun()
-        
-        # Add new subject
-        st.markdown("**Add New Subject:**")
+            hours = st.number_input("Hours/Week", min_value=1, max_value=20, value=subject_data['hours_per_week'], key=f"hours_{subject_name}")
+            st.session_state.subjects[subject_name]['hours_per_week'] = hours
+        with col3:
+            teacher = st.text_input("Teacher", value=subject_data.get('teacher', ''), key=f"teacher_{subject_name}")
+            st.session_state.subjects[subject_name]['teacher'] = teacher
+        with col4:
+            single_teacher = st.checkbox("Single Teacher Only", value=subject_data.get('single_teacher', False), key=f"single_{subject_name}")
+            st.session_state.subjects[subject_name]['single_teacher'] = single_teacher
+        with col5:
+            st.button("Remove", key=f"remove_subj_{subject_name}",
+                      on_click=_remove_subject, args=(subject_name,))
+
+    # Add new subject — grouped in a form so typing in the fields does
+    # not rerun the whole script until submit
+    st.markdown("**Add New Subject:**")
+    with st.form("add_subject_form"):
         col1, col2, col3 = st.columns(3)
         with col1:
             new_subject = st.text_input("Subject Name", key="new_subject_name")
@@ -402,55 +624,54 @@ try:
             new_hours = st.number_input("Hours/Week", min_value=1, max_value=20, value=3, key="new_subject_hours")
         with col3:
             new_teacher = st.text_input("Teacher", key="new_subject_teacher")
-        
-        if st.button("➕ Add Subject") and new_subject:
-            if new_subject not in st.session_state.subjects:
-                st.session_state.subjects[new_subject] = {
-                    'hours_per_week': new_hours,
-                    'teacher': new_teacher,
-                    'single_teacher': False,
-                    'no_clash': False
-                }
-                st.rerun()
-    
-    # TAB 2: TIME SLOTS
-    with tab2:
-        st.header("Customizable Time Periods per Day")
-        st.caption("Define different time periods for each day of the week")
-        
-        selected_day = st.selectbox("Select Day", st.session_state.days, key="time_slot_day")
-        
-        if selected_day not in st.session_state.time_slots:
-            st.session_state.time_slots[selected_day] = []
-        
-        st.subheader(f"Time Slots for {selected_day}")
-        
-        # Display existing slots
-        slots_to_remove = []
-        for idx, slot in enumerate(st.session_state.time_slots[selected_day]):
-            col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
-            with col1:
-                name = st.text_input("Slot Name", value=slot['name'], key=f"slot_name_{selected_day}_{idx}")
-            with col2:
-                start = st.text_input("Start Time", value=slot['start'], key=f"slot_start_{selected_day}_{idx}", placeholder="7:30 AM")
-            with col3:
-                end = st.text_input("End Time", value=slot['end'], key=f"slot_end_{selected_day}_{idx}", placeholder="8:30 AM")
-            with col4:
-                if st.button("Remove", key=f"remove_slot_{selected_day}_{idx}"):
-                    slots_to_remove.append(idx)
-            
-            st.session_state.time_slots[selected_day][idx] = {
-                'name': name,
-                'start': start,
-                'end': end
+        add_subject = st.form_submit_button("➕ Add Subject")
+
+    if add_subject and new_subject:
+        if new_subject not in st.session_state.subjects:
+            st.session_state.subjects[new_subject] = {
+                'hours_per_week': new_hours,
+                'teacher': new_teacher,
+                'single_teacher': False,
+                'no_clash': False
             }
-        
-        # Remove slots
-        for idx in sorted(slots_to_remove, reverse=True):
-            st.session_state.time_slots[selected_day].pop(idx)
             st.rerun()
-        
-        # Add new slot
+
+@st.fragment
+def _render_time_slots_tab():
+    """Render the per-day time slot editor"""
+    st.header("Customizable Time Periods per Day")
+    st.caption("Define different time periods for each day of the week")
+    
+    selected_day = st.selectbox("Select Day", st.session_state.days, key="time_slot_day")
+    
+    # Work on the day's slot list through one reference; the dict lives
+    # in session state, so in-place mutations persist
+    day_slots = st.session_state.time_slots.setdefault(selected_day, [])
+
+    st.subheader(f"Time Slots for {selected_day}")
+
+    # Display existing slots
+    for idx, slot in enumerate(day_slots):
+        col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
+        with col1:
+            name = st.text_input("Slot Name", value=slot['name'], key=f"slot_name_{selected_day}_{idx}")
+        with col2:
+            start = st.text_input("Start Time", value=slot['start'], key=f"slot_start_{selected_day}_{idx}", placeholder="7:30 AM")
+        with col3:
+            end = st.text_input("End Time", value=slot['end'], key=f"slot_end_{selected_day}_{idx}", placeholder="8:30 AM")
+        with col4:
+            st.button("Remove", key=f"remove_slot_{selected_day}_{idx}",
+                      on_click=_remove_time_slot, args=(selected_day, idx))
+
+        day_slots[idx] = {
+            'name': name,
+            'start': start,
+            'end': end
+        }
+
+    # Add new slot — form so the three inputs rerun the script once,
+    # on submit, rather than per field
+    with st.form(f"add_slot_form_{selected_day}"):
         col1, col2, col3 = st.columns(3)
         with col1:
             new_slot_name = st.text_input("New Slot Name", key=f"new_slot_name_{selected_day}", placeholder="Period 1")
@@ -458,349 +679,386 @@ try:
             new_slot_start = st.text_input("Start Time", key=f"new_slot_start_{selected_day}", placeholder="7:30 AM")
         with col3:
             new_slot_end = st.text_input("End Time", key=f"new_slot_end_{selected_day}", placeholder="8:30 AM")
-        
-        if st.button("➕ Add Time Slot") and new_slot_name and new_slot_start and new_slot_end:
-            st.session_state.time_slots[selected_day].append({
-                'name': new_slot_name,
-                'start': new_slot_start,
-                'end': new_slot_end
-            })
-            st.rerun()
-        
-        # Validate
-        errors, warnings = validate_time_slots()
-        if errors:
-            st.error("**Time Slot Errors:**")
-            for error in errors:
-                st.error(f"⚠️ {error}")
-        if warnings:
-            st.warning("**Warnings:**")
-            for warning in warnings:
-                st.warning(f"⚠️ {warning}")
+        add_slot = st.form_submit_button("➕ Add Time Slot")
+
+    if add_slot and new_slot_name and new_slot_start and new_slot_end:
+        day_slots.append({
+            'name': new_slot_name,
+            'start': new_slot_start,
+            'end': new_slot_end
+        })
+        st.rerun()
     
-    # TAB 3: FIXED EVENTS
-    with tab3:
-        st.header("Fixed Events Spanning Multiple Days")
-        st.caption("Events like assembly that occur at the same time every day")
-        
-        # Display existing fixed events
-        events_to_remove = []
-        for idx, event in enumerate(st.session_state.fixed_events):
-            col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 1, 1])
-            with col1:
-                name = st.text_input("Event Name", value=event['name'], key=f"event_name_{idx}")
-            with col2:
-                start = st.text_input("Start Time", value=event['start_time'], key=f"event_start_{idx}", placeholder="3:00 PM")
-            with col3:
-                end = st.text_input("End Time", value=event['end_time'], key=f"event_end_{idx}", placeholder="3:15 PM")
-            with col4:
-                same_all = st.checkbox("All Days", value=event.get('same_all_days', False), key=f"event_all_{idx}")
-            with col5:
-                if st.button("Remove", key=f"remove_event_{idx}"):
-                    events_to_remove.append(idx)
-            
-            st.session_state.fixed_events[idx] = {
-                'name': name,
-                'start_time': start,
-                'end_time': end,
-                'same_all_days': same_all
-            }
-        
-        for idx in sorted(events_to_remove, reverse=True):
-            st.session_state.fixed_events.pop(idx)
-            st.rerun()
-        
-        # Add new fixed event
-        st.markdown("**Add New Fixed Event:**")
-        col1, col2, col3, col4 = st.columns(4)
+    # Validate
+    errors, warnings = validate_time_slots()
+    if errors:
+        st.error("**Time Slot Errors:**")
+        for error in errors:
+            st.error(f"⚠️ {error}")
+    if warnings:
+        st.warning("**Warnings:**")
+        for warning in warnings:
+            st.warning(f"⚠️ {warning}")
+
+@st.fragment
+def _render_fixed_events_tab():
+    """Render the fixed events editor"""
+    st.header("Fixed Events Spanning Multiple Days")
+    st.caption("Events like assembly that occur at the same time every day")
+    
+    # Display existing fixed events
+    for idx, event in enumerate(st.session_state.fixed_events):
+        col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 1, 1])
         with col1:
-            new_event_name = st.text_input("Event Name", key="new_event_name", placeholder="Assembly")
+            name = st.text_input("Event Name", value=event['name'], key=f"event_name_{idx}")
         with col2:
-            new_event_start = st.text_input("Start Time", key="new_event_start", placeholder="3:00 PM")
+            start = st.text_input("Start Time", value=event['start_time'], key=f"event_start_{idx}", placeholder="3:00 PM")
         with col3:
-            new_event_end = st.text_input("End Time", key="new_event_end", placeholder="3:15 PM")
+            end = st.text_input("End Time", value=event['end_time'], key=f"event_end_{idx}", placeholder="3:15 PM")
         with col4:
-            new_event_all_days = st.checkbox("Same for all days (Mon-Fri)", key="new_event_all_days")
-        
-        if st.button("➕ Add Fixed Event") and new_event_name and new_event_start and new_event_end:
-            st.session_state.fixed_events.append({
-                'name': new_event_name,
-                'start_time': new_event_start,
-                'end_time': new_event_end,
-                'same_all_days': new_event_all_days
-            })
-            st.rerun()
+            same_all = st.checkbox("All Days", value=event.get('same_all_days', False), key=f"event_all_{idx}")
+        with col5:
+            st.button("Remove", key=f"remove_event_{idx}",
+                      on_click=_remove_fixed_event, args=(idx,))
+
+        st.session_state.fixed_events[idx] = {
+            'name': name,
+            'start_time': start,
+            'end_time': end,
+            'same_all_days': same_all
+        }
+
+    # Add new fixed event
+    st.markdown("**Add New Fixed Event:**")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        new_event_name = st.text_input("Event Name", key="new_event_name", placeholder="Assembly")
+    with col2:
+        new_event_start = st.text_input("Start Time", key="new_event_start", placeholder="3:00 PM")
+    with col3:
+        new_event_end = st.text_input("End Time", key="new_event_end", placeholder="3:15 PM")
+    with col4:
+        new_event_all_days = st.checkbox("Same for all days (Mon-Fri)", key="new_event_all_days")
     
-    # TAB 4: FIXED ASSIGNMENTS
-    with tab4:
-        st.header("Non-Negotiable Fixed Assignments")
-        st.caption("Part-time teachers or other fixed time constraints")
-        
-        # Display existing fixed assignments
-        assignments_to_remove = []
-        for idx, assignment in enumerate(st.session_state.fixed_assignments):
-            col1, col2, col3, col4, col5, col6, col7 = st.columns([2, 2, 2, 2, 2, 1, 1])
-            with col1:
-                class_name = st.selectbox("Class", st.session_state.classes, 
-                                        index=st.session_state.classes.index(assignment['class']) if assignment['class'] in st.session_state.classes else 0,
-                                        key=f"fixed_class_{idx}")
-            with col2:
-                day = st.selectbox("Day", st.session_state.days,
-                                 index=st.session_state.days.index(assignment['day']) if assignment['day'] in st.session_state.days else 0,
-                                 key=f"fixed_day_{idx}")
-            with col3:
-                start = st.text_input("Start", value=assignment['start_time'], key=f"fixed_start_{idx}", placeholder="8:00 AM")
-            with col4:
-                end = st.text_input("End", value=assignment['end_time'], key=f"fixed_end_{idx}", placeholder="10:00 AM")
-            with col5:
-                subject = st.selectbox("Subject", [""] + list(st.session_state.subjects.keys()),
-                                     index=([""] + list(st.session_state.subjects.keys())).index(assignment.get('subject', '')) if assignment.get('subject', '') in [""] + list(st.session_state.subjects.keys()) else 0,
-                                     key=f"fixed_subject_{idx}")
-            with col6:
-                teacher = st.text_input("Teacher", value=assignment.get('teacher', ''), key=f"fixed_teacher_{idx}")
-            with col7:
-                if st.button("Remove", key=f"remove_fixed_{idx}"):
-                    assignments_to_remove.append(idx)
-            
-            st.session_state.fixed_assignments[idx] = {
-                'class': class_name,
-                'day': day,
-                'start_time': start,
-                'end_time': end,
-                'subject': subject,
-                'teacher': teacher
-            }
-        
-        for idx in sorted(assignments_to_remove, reverse=True):
-            st.session_state.fixed_assignments.pop(idx)
-            st.rerun()
-        
-        # Add new fixed assignment
-        st.markdown("**Add New Fixed Assignment:**")
-        col1, col2, col3, col4, col5, col6 = st.columns(6)
+    if st.button("➕ Add Fixed Event") and new_event_name and new_event_start and new_event_end:
+        st.session_state.fixed_events.append({
+            'name': new_event_name,
+            'start_time': new_event_start,
+            'end_time': new_event_end,
+            'same_all_days': new_event_all_days
+        })
+        st.rerun()
+
+@st.fragment
+def _render_fixed_assignments_tab():
+    """Render the fixed assignments editor"""
+    st.header("Non-Negotiable Fixed Assignments")
+    st.caption("Part-time teachers or other fixed time constraints")
+    
+    # Display existing fixed assignments
+    # Position maps computed once per rerun; avoids an O(N) list.index
+    # call per rendered row
+    class_pos = {c: i for i, c in enumerate(st.session_state.classes)}
+    day_pos = {d: i for i, d in enumerate(st.session_state.days)}
+    # Immutable, so the same tuple is safely shared by every selectbox
+    # in this tab instead of rebuilding the list per widget
+    subject_options = ("",) + tuple(st.session_state.subjects)
+    subject_pos = {s: i for i, s in enumerate(subject_options)}
+
+    for idx, assignment in enumerate(st.session_state.fixed_assignments):
+        col1, col2, col3, col4, col5, col6, col7 = st.columns([2, 2, 2, 2, 2, 1, 1])
         with col1:
-            new_fixed_class = st.selectbox("Class", st.session_state.classes, key="new_fixed_class")
+            class_name = st.selectbox("Class", st.session_state.classes,
+                                    index=class_pos.get(assignment['class'], 0),
+                                    key=f"fixed_class_{idx}")
         with col2:
-            new_fixed_day = st.selectbox("Day", st.session_state.days, key="new_fixed_day")
+            day = st.selectbox("Day", st.session_state.days,
+                             index=day_pos.get(assignment['day'], 0),
+                             key=f"fixed_day_{idx}")
         with col3:
-            new_fixed_start = st.text_input("Start Time", key="new_fixed_start", placeholder="8:00 AM")
+            start = st.text_input("Start", value=assignment['start_time'], key=f"fixed_start_{idx}", placeholder="8:00 AM")
         with col4:
-            new_fixed_end = st.text_input("End Time", key="new_fixed_end", placeholder="10:00 AM")
+            end = st.text_input("End", value=assignment['end_time'], key=f"fixed_end_{idx}", placeholder="10:00 AM")
         with col5:
-            new_fixed_subject = st.selectbox("Subject", [""] + list(st.session_state.subjects.keys()), key="new_fixed_subject")
+            subject = st.selectbox("Subject", subject_options,
+                                 index=subject_pos.get(assignment.get('subject', ''), 0),
+                                 key=f"fixed_subject_{idx}")
         with col6:
-            new_fixed_teacher = st.text_input("Teacher", key="new_fixed_teacher")
-        
-        if st.button("➕ Add Fixed Assignment") and new_fixed_class and new_fixed_day and new_fixed_start and new_fixed_end:
-            st.session_state.fixed_assignments.append({
-                'class': new_fixed_class,
-                'day': new_fixed_day,
-                'start_time': new_fixed_start,
-                'end_time': new_fixed_end,
-                'subject': new_fixed_subject,
-                'teacher': new_fixed_teacher
-            })
+            teacher = st.text_input("Teacher", value=assignment.get('teacher', ''), key=f"fixed_teacher_{idx}")
+        with col7:
+            st.button("Remove", key=f"remove_fixed_{idx}",
+                      on_click=_remove_fixed_assignment, args=(idx,))
+
+        st.session_state.fixed_assignments[idx] = {
+            'class': class_name,
+            'day': day,
+            'start_time': start,
+            'end_time': end,
+            'subject': subject,
+            'teacher': teacher
+        }
+
+    # Add new fixed assignment
+    st.markdown("**Add New Fixed Assignment:**")
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    with col1:
+        new_fixed_class = st.selectbox("Class", st.session_state.classes, key="new_fixed_class")
+    with col2:
+        new_fixed_day = st.selectbox("Day", st.session_state.days, key="new_fixed_day")
+    with col3:
+        new_fixed_start = st.text_input("Start Time", key="new_fixed_start", placeholder="8:00 AM")
+    with col4:
+        new_fixed_end = st.text_input("End Time", key="new_fixed_end", placeholder="10:00 AM")
+    with col5:
+        new_fixed_subject = st.selectbox("Subject", subject_options, key="new_fixed_subject")
+    with col6:
+        new_fixed_teacher = st.text_input("Teacher", key="new_fixed_teacher")
+    
+    if st.button("➕ Add Fixed Assignment") and new_fixed_class and new_fixed_day and new_fixed_start and new_fixed_end:
+        st.session_state.fixed_assignments.append({
+            'class': new_fixed_class,
+            'day': new_fixed_day,
+            'start_time': new_fixed_start,
+            'end_time': new_fixed_end,
+            'subject': new_fixed_subject,
+            'teacher': new_fixed_teacher
+        })
+        st.rerun()
+
+@st.fragment
+def _render_integrate_tab():
+    """Render the external timetable upload tab"""
+    st.header("Integrate Other Timetable")
+    st.caption("Upload another timetable (CSV/Excel) to avoid teacher clashes")
+    
+    uploaded_file = st.file_uploader("Upload Timetable", type=['csv', 'xlsx', 'xls'])
+    
+    if uploaded_file:
+        try:
+            # Cached on the file bytes, so reruns after the first upload
+            # skip the re-parse
+            df_other = _load_uploaded(uploaded_file.name, uploaded_file.getvalue())
+
+            st.session_state.other_timetable = df_other
+            st.success("Timetable uploaded successfully!")
+            st.dataframe(df_other.head(10))
+        except Exception as e:
+            st.error(f"Error reading file: {str(e)}")
+    
+    if st.session_state.other_timetable is not None:
+        if st.button("Clear Uploaded Timetable"):
+            st.session_state.other_timetable = None
             st.rerun()
+
+@st.fragment
+def _render_generate_tab():
+    """Render generation, clash checks, display and exports"""
+    st.header("Generate & View Timetable")
     
-    # TAB 5: INTEGRATE OTHER TIMETABLE
-    with tab5:
-        st.header("Integrate Other Timetable")
-        st.caption("Upload another timetable (CSV/Excel) to avoid teacher clashes")
-        
-        uploaded_file = st.file_uploader("Upload Timetable", type=['csv', 'xlsx', 'xls'])
-        
-        if uploaded_file:
+    color_options = _COLOR_OPTIONS
+
+
+    selected_class = st.selectbox("Select Class", st.session_state.classes, key="view_class")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔄 Generate Timetable", type="primary"):
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df_other = pd.read_csv(uploaded_file)
-                else:
-                    df_other = pd.read_excel(uploaded_file)
-                
-                st.session_state.other_timetable = df_other
-                st.success("Timetable uploaded successfully!")
-                st.dataframe(df_other.head(10))
+                with st.spinner("Generating timetable..."):
+                    # Validate inputs first
+                    if not st.session_state.time_slots:
+                        st.error("Please define time slots in the 'Time Slots' tab first.")
+                    elif not st.session_state.classes:
+                        st.error("Please define classes in the 'Setup' tab first.")
+                    else:
+                        df, all_slots, slot_index, same_time_index = generate_timetable_grid(
+                            selected_class,
+                            st.session_state.days,
+                            st.session_state.time_slots
+                        )
+
+                        # Apply fixed events
+                        if st.session_state.fixed_events:
+                            apply_fixed_events(df, all_slots, st.session_state.fixed_events, same_time_index)
+
+                        # Apply fixed assignments
+                        if st.session_state.fixed_assignments:
+                            apply_fixed_assignments(df, all_slots, st.session_state.fixed_assignments, selected_class, slot_index)
+
+                        # Auto-generate subjects
+                        if st.session_state.subjects:
+                            auto_generate_subjects(df, all_slots, selected_class, st.session_state.subjects)
+
+                        # Store in session state in compact encoded form
+                        _store_timetable(selected_class, df, all_slots)
+                        st.session_state.generation_status[selected_class] = "Generated"
+
+                        st.success(f"Timetable generated for {selected_class}!")
+                        st.rerun()
             except Exception as e:
-                st.error(f"Error reading file: {str(e)}")
-        
-        if st.session_state.other_timetable is not None:
-            if st.button("Clear Uploaded Timetable"):
-                st.session_state.other_timetable = None
-                st.rerun()
+                st.error(f"Error generating timetable: {str(e)}")
+                if st.checkbox("Show detailed error", key="show_error"):
+                    st.code(traceback.format_exc())
     
-    # TAB 6: GENERATE & VIEW
-    with tab6:
-        st.header("Generate & View Timetable")
+    with col2:
+        if st.button("🔍 Check Clashes"):
+            if selected_class in st.session_state.timetable_data:
+                clashes = check_teacher_clashes(st.session_state.timetable_data, selected_class)
+                if clashes:
+                    st.error("**Clashes Found:**")
+                    for clash in clashes:
+                        st.error(f"⚠️ {clash}")
+                else:
+                    st.success("✅ No clashes detected!")
+    
+    # Display timetable
+    if selected_class in st.session_state.timetable_data:
+        df, all_slots = _load_timetable(st.session_state.timetable_data, selected_class)
+
+        # Bind the state this whole block reads to locals once; every
+        # st.session_state access goes through the proxy's __getattr__
+        days = st.session_state.days
+        colors_root = st.session_state.timetable_colors
+        school_name = st.session_state.school_name
+
+        st.markdown(f'<div class="school-name">{school_name} - {selected_class}</div>', unsafe_allow_html=True)
+
+        # Color customization
+        st.subheader("Color Customization")
+        st.caption("Select colors for timetable cells")
+
+        # Get unique values in timetable: dedupe the raw cells first so the
+        # teacher-suffix strip runs per distinct value, not per cell
+        cells = pd.unique(df[list(days)].to_numpy().ravel().astype(str))
+        bases = pd.Series(cells).str.split('(', n=1).str[0].str.strip()
+        unique_values = set(bases[bases != ''])
         
-        # Color options
-        color_options = {
-            'Red': '#ff6b6b',
-            'Blue': '#4ecdc4',
-            'Green': '#95e1d3',
-            'Yellow': '#fce38a',
-            'Orange': '#f38181',
-            'Purple': '#aa96da',
-            'Pink': '#fcbad3',
-            'Gray': '#d3d3d3',
-            'White': '#ffffff',
-            'Black': '#000000'
-        }
+        if unique_values:
+            # One data editor replaces a selectbox per subject, so color
+            # edits stay in a single widget instead of N
+            stored_colors = colors_root.get(selected_class, {})
+            # Inverse palette map built once; the old per-subject list
+            # comprehension rescanned the palette for every row
+            color_to_name = {v: k for k, v in color_options.items()}
+            current_names = [
+                color_to_name.get(stored_colors.get(value, '#ffffff'), 'White')
+                for value in sorted(unique_values)
+            ]
+            color_df = pd.DataFrame({'Subject': sorted(unique_values), 'Color': current_names})
+            # The form holds back reruns until Apply, so editing several
+            # rows costs one rerun instead of one per edit
+            with st.form(f"color_form_{selected_class}"):
+                edited = st.data_editor(
+                    color_df,
+                    column_config={
+                        'Color': st.column_config.SelectboxColumn(
+                            "Color", options=list(color_options), required=True
+                        ),
+                    },
+                    disabled=['Subject'],
+                    hide_index=True,
+                    key=f"color_editor_{selected_class}"
+                )
+                apply_colors = st.form_submit_button("Apply colors")
+
+            if apply_colors:
+                color_mapping = {
+                    row.Subject: color_options[row.Color]
+                    for row in edited.itertuples(index=False)
+                }
+                colors_root.setdefault(selected_class, {}).update(color_mapping)
         
-        selected_class = st.selectbox("Select Class", st.session_state.classes, key="view_class")
+        # Display styled timetable
+        st.subheader("Timetable View")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("🔄 Generate Timetable", type="primary"):
-                try:
-                    with st.spinner("Generating timetable..."):
-                        # Validate inputs first
-                        if not st.session_state.time_slots:
-                            st.error("Please define time slots in the 'Time Slots' tab first.")
-                        elif not st.session_state.classes:
-                            st.error("Please define classes in the 'Setup' tab first.")
-                        else:
-                            df, all_slots = generate_timetable_grid(
-                                selected_class,
-                                st.session_state.days,
-                                st.session_state.time_slots
-                            )
-                            
-                            # Apply fixed events
-                            if st.session_state.fixed_events:
-                                apply_fixed_events(df, all_slots, st.session_state.fixed_events)
-                            
-                            # Apply fixed assignments
-                            if st.session_state.fixed_assignments:
-                                apply_fixed_assignments(df, all_slots, st.session_state.fixed_assignments, selected_class)
-                            
-                            # Auto-generate subjects
-                            if st.session_state.subjects:
-                                auto_generate_subjects(df, all_slots, selected_class, st.session_state.subjects)
-                            
-                            # Store in session state (limit size to prevent memory issues)
-                            st.session_state.timetable_data[selected_class] = (df, all_slots)
-                            st.session_state.generation_status[selected_class] = "Generated"
-                            
-                            # Clean up old data if too many classes
-                            if len(st.session_state.timetable_data) > 10:
-                                oldest_class = list(st.session_state.timetable_data.keys())[0]
-                                del st.session_state.timetable_data[oldest_class]
-                            
-                            st.success(f"Timetable generated for {selected_class}!")
-                            st.rerun()
-                except Exception as e:
-                    st.error(f"Error generating timetable: {str(e)}")
-                    if st.checkbox("Show detailed error", key="show_error"):
-                        st.code(traceback.format_exc())
+        # Render the HTML table through the cached builder; unrelated
+        # reruns get the cached string back instead of rebuilding
+        display_days = tuple(days)
+        records = tuple(tuple(str(v) for v in row) for row in df[list(display_days)].to_numpy())
+        class_colors = colors_root.get(selected_class, {})
+        html_table = build_timetable_html(
+            records,
+            tuple(df.index),
+            display_days,
+            tuple(sorted(class_colors.items()))
+        )
+        st.markdown(html_table, unsafe_allow_html=True)
         
-        with col2:
-            if st.button("🔍 Check Clashes"):
-                if selected_class in st.session_state.timetable_data:
-                    clashes = check_teacher_clashes(st.session_state.timetable_data, selected_class)
-                    if clashes:
-                        st.error("**Clashes Found:**")
-                        for clash in clashes:
-                            st.error(f"⚠️ {clash}")
-                    else:
-                        st.success("✅ No clashes detected!")
+        # Export options
+        st.markdown("---")
+        st.subheader("Export Options")
         
-        # Display timetable
-        if selected_class in st.session_state.timetable_data:
-            df, all_slots = st.session_state.timetable_data[selected_class]
-            
-            st.markdown(f'<div class="school-name">{st.session_state.school_name} - {selected_class}</div>', unsafe_allow_html=True)
-            
-            # Color customization
-            st.subheader("Color Customization")
-            st.caption("Select colors for timetable cells")
-            
-            # Get unique values in timetable
-            unique_values = set()
-            for day in st.session_state.days:
-                for idx in range(len(df)):
-                    value = str(df.loc[df.index[idx], day])
-                    if value:
-                        unique_values.add(value.split('(')[0].strip())
-            
-            if unique_values:
-                color_mapping = {}
-                for value in sorted(unique_values):
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.write(f"**{value}**")
-                    with col2:
-                        current_color = st.session_state.timetable_colors.get(selected_class, {}).get(value, '#ffffff')
-                        color_name = [k for k, v in color_options.items() if v == current_color]
-                        selected_color_name = st.selectbox(
-                            "Color",
-                            list(color_options.keys()),
-                            index=list(color_options.keys()).index(color_name[0]) if color_name else 0,
-                            key=f"color_{selected_class}_{value}"
-                        )
-                        color_mapping[value] = color_options[selected_color_name]
-                
-                if selected_class not in st.session_state.timetable_colors:
-                    st.session_state.timetable_colors[selected_class] = {}
-                st.session_state.timetable_colors[selected_class].update(color_mapping)
-            
-            # Display styled timetable
-            st.subheader("Timetable View")
-            
-            # Create HTML table with colors
-            html_table = f"""
-            <div class="timetable-container">
-                <table class="timetable-table">
-                    <thead>
-                        <tr>
-                            <th class="period-header">Time Slots</th>
-            """
-            for day in st.session_state.days:
-                html_table += f'<th class="period-header">{day}</th>'
-            html_table += "</tr></thead><tbody>"
-            
-            for idx, slot in enumerate(all_slots):
-                html_table += f"<tr><td><strong>{df.index[idx]}</strong></td>"
-                for day in st.session_state.days:
-                    cell_value = str(df.loc[df.index[idx], day])
-                    # Get color
-                    cell_key = cell_value.split('(')[0].strip() if cell_value else ''
-                    bg_color = st.session_state.timetable_colors.get(selected_class, {}).get(cell_key, '#ffffff')
-                    text_color = '#000000' if bg_color != '#000000' else '#ffffff'
-                    
-                    html_table += f'<td style="background-color: {bg_color}; color: {text_color};">{cell_value}</td>'
-                html_table += "</tr>"
-            
-            html_table += "</tbody></table></div>"
-            st.markdown(html_table, unsafe_allow_html=True)
-            
-            # Export options
-            st.markdown("---")
-            st.subheader("Export Options")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                csv_data = df.to_csv(index=True)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            csv_data = export_to_csv(df)
+            st.download_button(
+                label="📥 Download CSV",
+                data=csv_data,
+                file_name=f"{school_name.replace(' ', '_')}_{selected_class}_timetable.csv",
+                mime="text/csv"
+            )
+
+        with col2:
+            try:
+                # Passing a callable defers the workbook build until the
+                # button is actually clicked
                 st.download_button(
-                    label="📥 Download CSV",
-                    data=csv_data,
-                    file_name=f"{st.session_state.school_name.replace(' ', '_')}_{selected_class}_timetable.csv",
-                    mime="text/csv"
+                    label="📥 Download Excel",
+                    data=lambda: export_to_excel({selected_class: (df, all_slots)}),
+                    file_name=f"{school_name.replace(' ', '_')}_{selected_class}_timetable.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
-            
-            with col2:
-                try:
-                    excel_data = export_to_excel({selected_class: (df, all_slots)})
-                    st.download_button(
-                        label="📥 Download Excel",
-                        data=excel_data,
-                        file_name=f"{st.session_state.school_name.replace(' ', '_')}_{selected_class}_timetable.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                except Exception as e:
-                    st.warning(f"Excel export requires openpyxl. Install with: pip install openpyxl")
-        
-        else:
-            st.info("Generate a timetable first using the button above.")
+            except Exception as e:
+                st.warning(f"Excel export requires xlsxwriter. Install with: pip install xlsxwriter")
+
+        with col3:
+            try:
+                parquet_data = export_to_parquet(df)
+                st.download_button(
+                    label="📥 Download Parquet",
+                    data=parquet_data,
+                    file_name=f"{school_name.replace(' ', '_')}_{selected_class}_timetable.parquet",
+                    mime="application/octet-stream"
+                )
+            except Exception as e:
+                st.warning(f"Parquet export requires pyarrow. Install with: pip install pyarrow")
+    
+    else:
+        st.info("Generate a timetable first using the button above.")
+
+# Main app with comprehensive error handling
+try:
+    # Add loading state to prevent multiple simultaneous operations
+    if 'app_ready' not in st.session_state:
+        st.session_state.app_ready = True
+    
+    if not st.session_state.app_ready:
+        st.warning("App is initializing... Please wait.")
+        st.stop()
+    
+    st.title("📅 Ghana Timetable Generator")
+    st.markdown("**By Samuel Nhyira Cann**")
+    st.markdown("---")
+    
+    # Tabs
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        "Setup", "Time Slots", "Fixed Events", "Fixed Assignments", 
+        "Integrate Other Timetable", "Generate & View"
+    ])
     
+    with tab1:
+        _render_setup_tab()
+    with tab2:
+        _render_time_slots_tab()
+    with tab3:
+        _render_fixed_events_tab()
+    with tab4:
+        _render_fixed_assignments_tab()
+    with tab5:
+        _render_integrate_tab()
+    with tab6:
+        _render_generate_tab()
+
     # Sidebar
     with st.sidebar:
         st.header("ℹ️ About")
@@ -820,15 +1078,11 @@ try:
         st.markdown("---")
         if st.button("🔄 Reset All Data"):
             try:
-                # Clear large data structures first
-                if 'timetable_data' in st.session_state:
-                    del st.session_state.timetable_data
-                if 'other_timetable' in st.session_state:
-                    del st.session_state.other_timetable
-                # Reset to defaults
-                for key in list(st.session_state.keys()):
-                    if key != 'app_ready':
-                        del st.session_state[key]
+                # One bulk clear instead of deleting key by key, keeping
+                # only the init guard alive across the reset
+                app_ready = st.session_state.get('app_ready', True)
+                st.session_state.clear()
+                st.session_state.app_ready = app_ready
                 init_session_state()
                 st.success("Data reset successfully!")
                 st.rerun()